@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+# Offline stage: clip library -> transitions.json (pose distance between every clip's exit window
+# and every clip's entry window, best exit/entry frames and recommended blend length per pair).
+# Clips: BVH files referenced by mapping.json, plus optional retargeted VRM quaternion tracks
+# (the {frame, quaternions} records written by stroke_to_vrm_quaternions.py, NDJSON or JSON array).
+# Usage: python build_transitions.py [--tracks a_vrm_quaternions.ndjson ...] [--output transitions.json]
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+from scipy.spatial.transform import Rotation
+
+from gloss_to_timeline import SCRIPT_DIR, _gloss_to_bvh_path
+
+sys.path.insert(0, os.path.normpath(os.path.join(SCRIPT_DIR, "..", "..")))
+from frame_stream import iter_frame_records  # noqa: E402
+
+TRANSITIONS_NAME = "transitions.json"
+DEFAULT_FRAME_TIME = 1.0 / 30
+
+WINDOW_FRAMES = 15            # frames searched at the tail (exit) / head (entry) of each clip
+TRIM_PENALTY = 0.05           # rad per fully-trimmed window, prefers cutting as little as possible
+BLEND_RAD_PER_FRAME = 0.04    # mean joint rotation the blend is allowed to cover per frame
+BLEND_MIN_FRAMES = 3
+BLEND_MAX_FRAMES = 20
+
+
+def _parse_bvh(bvh_path: str) -> tuple[list[str], list[tuple[int, str]], float, np.ndarray]:
+    """Return (joint names, per-joint (column of first rotation channel, euler order), frame time, motion)."""
+    with open(bvh_path, "r", encoding="utf-8", errors="ignore") as f:
+        lines = f.read().splitlines()
+
+    joints, rot_channels = [], []
+    column = 0
+    i = 0
+    while i < len(lines):
+        tokens = lines[i].split()
+        i += 1
+        if not tokens:
+            continue
+        if tokens[0] in ("ROOT", "JOINT"):
+            joints.append(" ".join(tokens[1:]))
+        elif tokens[0] == "CHANNELS":
+            channels = tokens[2:]
+            rot = [(k, c[0].upper()) for k, c in enumerate(channels) if c.lower().endswith("rotation")]
+            if len(rot) != 3 or rot[2][0] - rot[0][0] != 2:
+                raise ValueError(f"Unsupported rotation channels in {bvh_path}: {channels}")
+            rot_channels.append((column + rot[0][0], "".join(axis for _, axis in rot)))
+            column += len(channels)
+        elif tokens[0] == "MOTION":
+            break
+
+    frame_time = DEFAULT_FRAME_TIME
+    rows = []
+    for line in lines[i:]:
+        stripped = line.strip()
+        if not stripped or stripped.lower().startswith("frames:"):
+            continue
+        if stripped.lower().startswith("frame time:"):
+            frame_time = float(stripped.split(":", 1)[1])
+            continue
+        rows.append(stripped.split())
+    motion = np.asarray(rows, dtype=float).reshape(-1, column) if rows else np.zeros((0, column))
+    return joints, rot_channels, frame_time, motion
+
+
+def _bvh_clip(bvh_path: str) -> dict:
+    joints, rot_channels, frame_time, motion = _parse_bvh(bvh_path)
+    n = motion.shape[0]
+    quats = np.zeros((n, len(joints), 4))
+    for j, (col, order) in enumerate(rot_channels):
+        # BVH channels are intrinsic rotations applied in channel order -> scipy uppercase sequence.
+        quats[:, j] = Rotation.from_euler(order, motion[:, col:col + 3], degrees=True).as_quat()
+    return {"skeleton": tuple(joints), "frame_time": frame_time, "quats": quats}
+
+
+def _quaternion_track_clip(track_path: str) -> dict:
+    data = list(iter_frame_records(track_path))
+    bones = sorted(data[0]["quaternions"]) if data else []
+    quats = np.asarray([[item["quaternions"][b] for b in bones] for item in data], dtype=float)
+    return {"skeleton": tuple(bones), "frame_time": DEFAULT_FRAME_TIME, "quats": quats.reshape(len(data), len(bones), 4)}
+
+
+def _windows(quats: np.ndarray, window: int) -> tuple[np.ndarray, np.ndarray, np.ndarray, int]:
+    """Exit window (last frames), entry window (first frames), and validity mask, padded to `window`."""
+    n = quats.shape[0]
+    w = min(window, n)
+    valid = np.zeros(window, dtype=bool)
+    valid[:w] = True
+    pad = [(0, window - w)] + [(0, 0)] * (quats.ndim - 1)
+    exit_w = np.pad(quats[n - w:], pad, mode="edge")
+    entry_w = np.pad(quats[:w], pad, mode="edge")
+    return exit_w, entry_w, valid, w
+
+
+def compute_transitions(clips: dict[str, dict], window: int = WINDOW_FRAMES) -> dict:
+    """
+    All-pairs transition table. Distance between two poses = mean geodesic angle (rad) over joints.
+    For each (src, dst) returns the exit frame in src, entry frame in dst, cost and blend length.
+    """
+    by_skeleton: dict[tuple, list[str]] = {}
+    for name, clip in clips.items():
+        if clip["quats"].shape[0] > 0:
+            by_skeleton.setdefault(clip["skeleton"], []).append(name)
+
+    # Penalty grows with the number of frames dropped from the end of src / start of dst.
+    trim_exit = TRIM_PENALTY * (window - 1 - np.arange(window)) / window
+    trim_entry = TRIM_PENALTY * np.arange(window) / window
+
+    table: dict[str, dict[str, dict]] = {}
+    for names in by_skeleton.values():
+        wins = [_windows(clips[name]["quats"], window) for name in names]
+        exits = np.stack([w[0] for w in wins])     # (N, W, J, 4)
+        entries = np.stack([w[1] for w in wins])   # (N, W, J, 4)
+        valid = np.stack([w[2] for w in wins])     # (N, W)
+
+        for a, src in enumerate(names):
+            # |q1 . q2| handles the q / -q double cover; (W_exit, N, W_entry, J)
+            dots = np.abs(np.einsum("ijq,nkjq->inkj", exits[a], entries))
+            dist = 2.0 * np.arccos(np.clip(dots, 0.0, 1.0)).mean(axis=-1)
+            cost = dist + trim_exit[:, None, None] + trim_entry[None, None, :]
+            cost[~valid[a]] = np.inf
+            cost = np.where(valid[None, :, :], cost, np.inf)
+
+            flat = cost.transpose(1, 0, 2).reshape(len(names), -1)  # (N, W_exit * W_entry)
+            best = flat.argmin(axis=1)
+            best_i, best_k = np.unravel_index(best, (window, window))
+            frame_time = clips[src]["frame_time"]
+            n_src = clips[src]["quats"].shape[0]
+            w_src = wins[a][3]
+
+            row = {}
+            for b, dst in enumerate(names):
+                i, k = int(best_i[b]), int(best_k[b])
+                pose_dist = float(dist[i, b, k])
+                blend_frames = int(np.clip(round(pose_dist / BLEND_RAD_PER_FRAME), BLEND_MIN_FRAMES, BLEND_MAX_FRAMES))
+                exit_frame = n_src - w_src + i
+                row[dst] = {
+                    "cost": round(pose_dist, 6),
+                    "exit_frame": exit_frame,
+                    "entry_frame": k,
+                    "exit_time": round((exit_frame + 1) * frame_time, 4),
+                    "entry_time": round(k * clips[dst]["frame_time"], 4),
+                    "blend_frames": blend_frames,
+                    "blend_duration": round(blend_frames * frame_time, 4),
+                }
+            table[src] = row
+    return table
+
+
+def load_library(mapping_path: str | None = None, track_paths: list[str] | None = None) -> dict[str, dict]:
+    """Gloss -> clip for every BVH in mapping.json; quaternion tracks are keyed by file stem."""
+    mapping_path = mapping_path or os.path.join(SCRIPT_DIR, "mapping.json")
+    with open(mapping_path, "r", encoding="utf-8") as f:
+        mapping = json.load(f)
+
+    clips = {}
+    for gloss in mapping:
+        bvh_path = _gloss_to_bvh_path(gloss, mapping)
+        if bvh_path is None or not os.path.isfile(bvh_path):
+            print("Skip (no bvh):", gloss)
+            continue
+        clips[gloss] = _bvh_clip(bvh_path)
+    for track_path in track_paths or []:
+        clips[os.path.splitext(os.path.basename(track_path))[0]] = _quaternion_track_clip(track_path)
+    return clips
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Clip library -> precomputed transition table")
+    parser.add_argument("--mapping", default=None, help="gloss -> fbx mapping (default: mapping.json)")
+    parser.add_argument("--tracks", nargs="*", default=[], help="Retargeted VRM quaternion tracks to include (JSON or NDJSON)")
+    parser.add_argument("--window", type=int, default=WINDOW_FRAMES, help="Exit/entry window length in frames")
+    parser.add_argument("-o", "--output", default=os.path.join(SCRIPT_DIR, TRANSITIONS_NAME),
+                        help="Output path (default: transitions.json next to this script)")
+    args = parser.parse_args()
+
+    clips = load_library(args.mapping, args.tracks)
+    table = compute_transitions(clips, args.window)
+    out = {"window": args.window, "clips": list(table), "transitions": table}
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(out, f, ensure_ascii=False, indent=2)
+    print("Wrote", args.output, f"({len(table)} clips, {sum(len(r) for r in table.values())} transitions)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 # Input: gloss list (JSON array). Output: timeline JSON (ordered clips with start_time, duration, bvh path).
+# If transitions.json (see build_transitions.py) exists, joins use its precomputed exit/entry frames and blends.
 # Usage: python gloss_to_timeline.py [path_to_gloss.json] [--output timeline.json]
 from __future__ import annotations
 
@@ -9,6 +10,7 @@ import os
 import re
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(os.path.realpath(__file__)))
+TRANSITIONS_PATH = os.path.join(SCRIPT_DIR, "transitions.json")
 
 
 def _bvh_duration(bvh_path: str) -> float:
@@ -33,22 +35,47 @@ def _gloss_to_bvh_path(gloss: str, mapping: dict) -> str | None:
     return os.path.join(SCRIPT_DIR, base + ".bvh")
 
 
-def build_timeline(gloss_list: list[str], mapping_path: str | None = None) -> list[dict]:
+def _load_transitions(transitions_path: str | None) -> dict:
+    transitions_path = transitions_path or TRANSITIONS_PATH
+    if not os.path.isfile(transitions_path):
+        return {}
+    with open(transitions_path, "r", encoding="utf-8") as f:
+        return json.load(f).get("transitions", {})
+
+
+def build_timeline(gloss_list: list[str], mapping_path: str | None = None,
+                   transitions_path: str | None = None) -> list[dict]:
     mapping_path = mapping_path or os.path.join(SCRIPT_DIR, "mapping.json")
     with open(mapping_path, "r", encoding="utf-8") as f:
         mapping = json.load(f)
+    transitions = _load_transitions(transitions_path)
 
     timeline = []
     t_start = 0.0
     for i, gloss in enumerate(gloss_list):
         bvh_path = _gloss_to_bvh_path(gloss, mapping)
         if bvh_path is None:
-            duration = 0.0
+            full = 0.0
             bvh_rel = None
         else:
-            duration = _bvh_duration(bvh_path)
+            full = _bvh_duration(bvh_path)
             bvh_rel = os.path.relpath(bvh_path, SCRIPT_DIR) if os.path.isfile(bvh_path) else bvh_path
 
+        # clip_in / clip_out: playback range inside the BVH; blend_in: overlap with the previous clip.
+        clip_in, clip_out, blend_in = 0.0, full, 0.0
+        prev = timeline[-1] if timeline else None
+        into = transitions.get(prev["gloss"], {}).get(gloss) if prev else None
+        if into is not None and full > 0:
+            clip_in = min(into["entry_time"], full)
+        nxt = gloss_list[i + 1] if i + 1 < len(gloss_list) else None
+        out_of = transitions.get(gloss, {}).get(nxt) if nxt is not None else None
+        if out_of is not None and full > 0:
+            clip_out = max(min(out_of["exit_time"], full), clip_in)
+        duration = clip_out - clip_in
+        if into is not None and prev is not None:
+            blend_in = min(into["blend_duration"], prev["duration"], duration)
+            t_start -= blend_in
+
         timeline.append({
             "index": i,
             "gloss": gloss,
@@ -56,6 +83,9 @@ def build_timeline(gloss_list: list[str], mapping_path: str | None = None) -> li
             "path_abs": bvh_path if bvh_path and os.path.isfile(bvh_path) else None,
             "start_time": round(t_start, 4),
             "duration": round(duration, 4),
+            "clip_in": round(clip_in, 4),
+            "clip_out": round(clip_out, 4),
+            "blend_in": round(blend_in, 4),
         })
         t_start += duration
     return timeline
@@ -73,7 +103,7 @@ def main():
         gloss_list = json.load(f)
 
     timeline = build_timeline(gloss_list)
-    out = {"gloss_list": gloss_list, "timeline": timeline, "total_duration": round(sum(c["duration"] for c in timeline), 4)}
+    out = {"gloss_list": gloss_list, "timeline": timeline, "total_duration": round(max((c["start_time"] + c["duration"] for c in timeline), default=0.0), 4)}
     s = json.dumps(out, ensure_ascii=False, indent=2)
 
     if args.output:
@@ -0,0 +1,152 @@
+"""
+列式帧存储 FrameStore：pose / 双手 / 面部锚点各存一块可增长的 float32 数组，配合有效性掩码。
+替代「每帧一个 dict + 嵌套 list」：每帧约 1KB（原先上万个 Python 对象、十余 KB），
+速度计算、Stroke 检测、导出、重定向都直接按数组切片读取。
+缺失帧不复制上一帧数据，只记掩码；需要时 filled() 一次性向量化前向填充。
+"""
+import numpy as np
+
+POSE_LANDMARKS_COUNT = 33
+HAND_LANDMARKS_COUNT = 21
+FACE_ANCHOR_NAMES = ["nose_tip", "chin", "left_temple", "right_temple", "glabella", "mouth_left", "mouth_right"]
+
+_INITIAL_CAPACITY = 256
+
+
+def _forward_fill_index(valid):
+    """每帧对应的最近一次有效帧下标；此前从未有效则为 -1。"""
+    idx = np.where(valid, np.arange(len(valid)), -1)
+    return np.maximum.accumulate(idx) if len(idx) else idx
+
+
+def _run_start(frame):
+    """每帧所在连续帧段（帧号逐一递增）的起始下标；按时间区间抽取时段与段之间有跳跃。"""
+    n = len(frame)
+    starts = np.zeros(n, dtype=np.int64)
+    if n > 1:
+        breaks = np.flatnonzero(np.diff(frame) != 1) + 1
+        starts[breaks] = breaks
+    return np.maximum.accumulate(starts) if n else starts
+
+
+def frame_record(frame_idx, pose, left_hand, right_hand, face_anchors):
+    """
+    单帧导出为 stroke_data.json 的记录格式（与旧版逐帧 dict 一致）。
+    pose / face_anchors 为 None 时输出 []；手为 None 时输出 21 个零点占位。
+    """
+    zero_hand = [[0.0, 0.0, 0.0]] * HAND_LANDMARKS_COUNT
+    return {
+        "frame": int(frame_idx),
+        "pose": pose.tolist() if pose is not None else [],
+        "left_hand": left_hand.tolist() if left_hand is not None else zero_hand,
+        "right_hand": right_hand.tolist() if right_hand is not None else zero_hand,
+        "face_anchors": [
+            {"name": name, "xyz": xyz}
+            for name, xyz in zip(FACE_ANCHOR_NAMES, face_anchors.tolist())
+        ] if face_anchors is not None else [],
+    }
+
+
+class FrameStore:
+    """按帧追加、列式存储的 Holistic 结果。len(store) 为帧数，各属性为长度 n 的数组视图。"""
+
+    _SHAPES = {
+        "pose": (POSE_LANDMARKS_COUNT, 3),
+        "left_hand": (HAND_LANDMARKS_COUNT, 3),
+        "right_hand": (HAND_LANDMARKS_COUNT, 3),
+        "face_anchors": (len(FACE_ANCHOR_NAMES), 3),
+    }
+
+    def __init__(self, capacity=_INITIAL_CAPACITY):
+        self._n = 0
+        self._cap = max(int(capacity), 1)
+        self._frame = np.zeros(self._cap, dtype=np.int64)
+        self._data = {k: np.zeros((self._cap,) + s, dtype=np.float32) for k, s in self._SHAPES.items()}
+        self._valid = {k: np.zeros(self._cap, dtype=bool) for k in self._SHAPES}
+
+    @classmethod
+    def from_records(cls, records):
+        """由 stroke_data.json / NDJSON 的帧记录重建；空 pose、全零占位手视为缺失。"""
+        store = cls()
+        for i, item in enumerate(records):
+            parts = []
+            for key in ("pose", "left_hand", "right_hand"):
+                arr = np.asarray(item.get(key) or [], dtype=np.float32)
+                parts.append(arr if arr.size and np.any(arr) else None)
+            anchors = item.get("face_anchors") or []
+            face = np.asarray([a["xyz"] for a in anchors], dtype=np.float32) if anchors else None
+            store.append(item.get("frame", i), *parts, face)
+        return store
+
+    def __len__(self):
+        return self._n
+
+    def _grow(self):
+        self._cap *= 2
+        self._frame = np.resize(self._frame, self._cap)
+        for k in self._SHAPES:
+            data = np.zeros((self._cap,) + self._SHAPES[k], dtype=np.float32)
+            data[:self._n] = self._data[k][:self._n]
+            self._data[k] = data
+            valid = np.zeros(self._cap, dtype=bool)
+            valid[:self._n] = self._valid[k][:self._n]
+            self._valid[k] = valid
+
+    def append(self, frame_idx, pose=None, left_hand=None, right_hand=None, face_anchors=None):
+        """追加一帧。各部分为 (N,3) 数组或 None；形状不符（如手部点数不全）视为缺失。"""
+        if self._n == self._cap:
+            self._grow()
+        i = self._n
+        self._frame[i] = frame_idx
+        for k, value in (("pose", pose), ("left_hand", left_hand),
+                         ("right_hand", right_hand), ("face_anchors", face_anchors)):
+            ok = value is not None and np.shape(value) == self._SHAPES[k]
+            self._valid[k][i] = ok
+            if ok:
+                self._data[k][i] = value
+        self._n += 1
+
+    @property
+    def frame(self):
+        return self._frame[:self._n]
+
+    def raw(self, key):
+        """(数据视图, 有效掩码)，未做填充。"""
+        return self._data[key][:self._n], self._valid[key][:self._n]
+
+    def filled(self, key):
+        """
+        前向填充后的数组（缺失帧沿用最近一次有效值）及 seen 掩码（此前是否出现过有效值）。
+        填充不跨越帧号不连续处；从未出现过的帧数据为 0。
+        """
+        data, valid = self.raw(key)
+        idx = _forward_fill_index(valid)
+        seen = (idx >= 0) & (idx >= _run_start(self.frame))
+        out = data[np.maximum(idx, 0)]
+        out[~seen] = 0.0
+        return out, seen
+
+    def wrist_velocity(self, left_wrist, right_wrist):
+        """相邻帧左右手腕位移的平均值（向量化）；任一帧尚无 pose 或帧号不连续时为 0。"""
+        pose, seen = self.filled("pose")
+        v = np.zeros(self._n)
+        if self._n < 2:
+            return v
+        step = np.diff(pose[:, [left_wrist, right_wrist]].astype(np.float64), axis=0)
+        dist = np.linalg.norm(step, axis=-1).mean(axis=-1)
+        v[1:] = np.where(seen[1:] & seen[:-1] & (np.diff(self.frame) == 1), dist, 0.0)
+        return v
+
+    def iter_records(self, indices=None):
+        """按帧下标（store 内位置）逐条 yield 导出记录，记录中的 frame 为原始帧号。"""
+        filled = {k: self.filled(k) for k in self._SHAPES}
+        for i in (range(self._n) if indices is None else indices):
+            parts = [filled[k][0][i] if filled[k][1][i] else None for k in self._SHAPES]
+            yield frame_record(self._frame[i], *parts)
+
+    def nbytes(self):
+        """当前已用帧所占字节数。"""
+        per_frame = self._frame.itemsize + sum(
+            self._data[k][0].nbytes + self._valid[k].itemsize for k in self._SHAPES
+        )
+        return per_frame * self._n
@@ -0,0 +1,59 @@
+"""
+逐帧流式读写：NDJSON（每行一个 JSON 帧记录）。
+写端边产生边落盘，读端边读边处理，内存只与单帧大小有关；前端可在第一帧到达后即开始播放。
+"""
+import json
+from pathlib import Path
+
+NDJSON_SUFFIXES = (".ndjson", ".jsonl")
+
+
+def is_ndjson_path(path):
+    """按扩展名判断是否为 NDJSON 文件。"""
+    return Path(path).suffix.lower() in NDJSON_SUFFIXES
+
+
+class NdjsonWriter:
+    """逐帧写 NDJSON。每次 write 立即 flush，下游可以 tail / 流式读取。"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.count = 0
+        self._f = open(self.path, "w", encoding="utf-8")
+
+    def write(self, record):
+        self._f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+        self._f.write("\n")
+        self._f.flush()
+        self.count += 1
+
+    def close(self):
+        if not self._f.closed:
+            self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def iter_ndjson(path):
+    """逐行读取 NDJSON，跳过空行，逐条 yield 帧记录。"""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def iter_frame_records(path):
+    """统一入口：NDJSON 流式读取；普通 JSON 数组整体读入后逐条 yield（兼容旧文件）。"""
+    if is_ndjson_path(path):
+        yield from iter_ndjson(path)
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if not isinstance(data, list):
+        data = [data]
+    yield from data
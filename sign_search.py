@@ -0,0 +1,321 @@
+"""
+手语片段检索：给一段新的打手语片段，在素材库中找最相近的 k 个片段（推荐 Gloss / 查重复素材）。
+
+流程：
+1. 归一化：双手以手腕为原点、按手掌尺寸（腕→中指根）缩放；上半身以双肩中点为原点、按肩宽缩放。
+   与画面位置、人物远近无关。
+2. 重采样到固定长度 RESAMPLE_LENGTH，库中所有片段堆成 (N, L, D) 的 float32 数组。
+3. 查询：PAA 嵌入（分段均值）做廉价预筛 → 候选集向量化计算 LB_Keogh 下界 →
+   按下界升序分批跑带 Sakoe-Chiba 窗口的向量化 DTW，下界超过当前第 k 名距离即停止。
+
+用法:
+  python sign_search.py index LIB_DIR -o sign_index.npz   # LIB_DIR/<gloss>/*.json|ndjson 或 LIB_DIR/<gloss>.json
+  python sign_search.py query sign_index.npz clip.json -k 5
+  python sign_search.py dups sign_index.npz --max-dist 1.0
+  python sign_search.py bench --sizes 1000 5000 10000 20000
+依赖: numpy
+"""
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+
+from frame_store import FrameStore
+from frame_stream import iter_frame_records
+
+POSE_L_SHOULDER, POSE_R_SHOULDER = 11, 12
+POSE_UPPER_BODY = [0, 11, 12, 13, 14, 15, 16]  # 鼻、肩、肘、腕
+HAND_WRIST, HAND_MIDDLE_MCP = 0, 9
+
+RESAMPLE_LENGTH = 24
+DTW_BAND = 3                 # Sakoe-Chiba 窗口半宽（帧），LB_Keogh 包络用同一宽度
+EMBED_SEGMENTS = 4           # PAA 分段数
+PREFILTER_CANDIDATES = 512   # 预筛保留的候选数；0 表示不预筛（精确搜索）
+DTW_BATCH = 64
+FEATURE_DIM = (len(POSE_UPPER_BODY) + 42) * 3
+
+_EPS = 1e-6
+
+
+# ---------------------------------------------------------------------------
+# 1. 归一化与特征
+# ---------------------------------------------------------------------------
+def _normalize_hand(hand, seen):
+    """(T,21,3) → 手腕为原点、手掌尺寸为 1；未出现过的帧保持 0。"""
+    rel = hand - hand[:, HAND_WRIST:HAND_WRIST + 1]
+    scale = np.linalg.norm(rel[:, HAND_MIDDLE_MCP], axis=-1)
+    rel = rel / np.maximum(scale, _EPS)[:, None, None]
+    rel[~seen] = 0.0
+    return rel
+
+
+def sequence_features(store):
+    """FrameStore → (T, FEATURE_DIM) 平移、缩放不变的特征序列。"""
+    pose, pose_seen = store.filled("pose")
+    left, left_seen = store.filled("left_hand")
+    right, right_seen = store.filled("right_hand")
+
+    center = (pose[:, POSE_L_SHOULDER] + pose[:, POSE_R_SHOULDER]) / 2
+    width = np.linalg.norm(pose[:, POSE_L_SHOULDER] - pose[:, POSE_R_SHOULDER], axis=-1)
+    body = (pose[:, POSE_UPPER_BODY] - center[:, None]) / np.maximum(width, _EPS)[:, None, None]
+    body[~pose_seen] = 0.0
+
+    feats = np.concatenate(
+        [body, _normalize_hand(left, left_seen), _normalize_hand(right, right_seen)], axis=1
+    )
+    return feats.reshape(len(store), FEATURE_DIM).astype(np.float32)
+
+
+def resample(seq, length=RESAMPLE_LENGTH):
+    """线性插值到固定帧数。"""
+    seq = np.asarray(seq, dtype=np.float32)
+    if len(seq) == 0:
+        return np.zeros((length, seq.shape[-1] if seq.ndim == 2 else FEATURE_DIM), dtype=np.float32)
+    src = np.linspace(0.0, len(seq) - 1, length)
+    lo = np.floor(src).astype(int)
+    hi = np.minimum(lo + 1, len(seq) - 1)
+    w = (src - lo)[:, None].astype(np.float32)
+    return seq[lo] * (1 - w) + seq[hi] * w
+
+
+def embed(seqs):
+    """PAA 嵌入：(..., L, D) → (..., EMBED_SEGMENTS * D)，用于廉价预筛。"""
+    seqs = np.asarray(seqs)
+    parts = np.array_split(seqs, EMBED_SEGMENTS, axis=-2)
+    return np.concatenate([p.mean(axis=-2) for p in parts], axis=-1)
+
+
+def clip_features(path):
+    """stroke_data 格式文件（JSON 数组或 NDJSON）→ 重采样后的特征序列。"""
+    return resample(sequence_features(FrameStore.from_records(iter_frame_records(path))))
+
+
+# ---------------------------------------------------------------------------
+# 2. 下界与 DTW
+# ---------------------------------------------------------------------------
+def envelope(q, band=DTW_BAND):
+    """查询序列的上下包络 (L,D)，窗口半宽 band。"""
+    L = len(q)
+    idx = np.clip(np.arange(L)[:, None] + np.arange(-band, band + 1)[None, :], 0, L - 1)
+    win = q[idx]
+    return win.max(axis=1), win.min(axis=1)
+
+
+def lb_keogh(upper, lower, cands):
+    """批量 LB_Keogh：cands (B,L,D) → (B,)，是带窗口 DTW（平方欧氏代价）的下界。"""
+    above = np.maximum(cands - upper, 0.0)
+    below = np.maximum(lower - cands, 0.0)
+    return np.sqrt((above * above + below * below).sum(axis=(1, 2)))
+
+
+def dtw_batch(q, cands, band=DTW_BAND):
+    """
+    q (L,D) 对 cands (B,L,D) 的带窗口 DTW 距离，按反对角线向量化：
+    同一反对角线上的格子只依赖前两条反对角线。
+    代价直接由差值平方求和（不用 |q|²+|c|²-2q·c 展开），避免相近值相减的精度损失，
+    保证完全相同的片段距离为 0、且不低于 LB_Keogh 下界。
+    """
+    B, L, _ = cands.shape
+    diff = q[None, :, None, :] - cands[:, None, :, :]
+    cost = (diff * diff).sum(-1)
+
+    acc = np.full((B, L + 1, L + 1), np.inf, dtype=np.float64)
+    acc[:, 0, 0] = 0.0
+    for s in range(2, 2 * L + 1):
+        i = np.arange(max(1, s - L), min(L, s - 1) + 1)
+        j = s - i
+        keep = np.abs(i - j) <= band
+        i, j = i[keep], j[keep]
+        if len(i) == 0:
+            continue
+        prev = np.minimum(np.minimum(acc[:, i - 1, j], acc[:, i, j - 1]), acc[:, i - 1, j - 1])
+        acc[:, i, j] = cost[:, i - 1, j - 1] + prev
+    return np.sqrt(acc[:, L, L])
+
+
+# ---------------------------------------------------------------------------
+# 3. 索引
+# ---------------------------------------------------------------------------
+class SignIndex:
+    """素材库索引：names / glosses 与重采样特征 seqs (N,L,D)、PAA 嵌入 embs (N,E) 一一对应。"""
+
+    def __init__(self, names, glosses, seqs):
+        self.names = list(names)
+        self.glosses = list(glosses)
+        self.seqs = np.ascontiguousarray(seqs, dtype=np.float32)
+        self.embs = embed(self.seqs).astype(np.float32)
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def from_library(cls, lib_dir):
+        """LIB_DIR/<gloss>/*.json|ndjson（子目录名为 gloss）或 LIB_DIR/<gloss>.json（文件名为 gloss）。"""
+        lib_dir = Path(lib_dir)
+        names, glosses, seqs = [], [], []
+        for path in sorted(lib_dir.rglob("*")):
+            if path.suffix.lower() not in (".json", ".ndjson", ".jsonl"):
+                continue
+            gloss = path.parent.name if path.parent != lib_dir else path.stem
+            names.append(str(path.relative_to(lib_dir)))
+            glosses.append(gloss)
+            seqs.append(clip_features(path))
+        return cls(names, glosses, np.stack(seqs) if seqs else np.zeros((0, RESAMPLE_LENGTH, FEATURE_DIM)))
+
+    def save(self, path):
+        np.savez_compressed(path, names=np.array(self.names), glosses=np.array(self.glosses), seqs=self.seqs)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        return cls(data["names"].tolist(), data["glosses"].tolist(), data["seqs"])
+
+    def search(self, query, k=5, prefilter=PREFILTER_CANDIDATES, band=DTW_BAND, exclude=None):
+        """
+        query: 重采样后的 (L,D) 特征。返回 ([(库内下标, name, gloss, dtw 距离)] 升序, 统计信息)。
+        prefilter > 0 时先按嵌入距离取前 prefilter 个候选（近似）；候选内 LB_Keogh 剪枝是精确的。
+        exclude: 需排除的库内下标（查重复时排除自身）。
+        """
+        q = np.asarray(query, dtype=np.float32)
+        n = len(self)
+        cand = np.arange(n)
+        if exclude is not None:
+            cand = cand[cand != exclude]
+        if prefilter and len(cand) > prefilter:
+            d_emb = ((self.embs[cand] - embed(q)) ** 2).sum(-1)
+            cand = cand[np.argpartition(d_emb, prefilter)[:prefilter]]
+
+        upper, lower = envelope(q, band)
+        lb = lb_keogh(upper, lower, self.seqs[cand])
+        order = np.argsort(lb)
+        cand, lb = cand[order], lb[order]
+
+        best_idx = np.empty(0, dtype=int)
+        best_dist = np.empty(0)
+        n_dtw = 0
+        for start in range(0, len(cand), DTW_BATCH):
+            kth = best_dist[k - 1] if len(best_dist) >= k else np.inf
+            batch = slice(start, start + DTW_BATCH)
+            alive = lb[batch] < kth
+            if not alive.any():
+                break
+            idx = cand[batch][alive]
+            dist = dtw_batch(q, self.seqs[idx], band)
+            n_dtw += len(idx)
+            best_idx = np.concatenate([best_idx, idx])
+            best_dist = np.concatenate([best_dist, dist])
+            top = np.argsort(best_dist)[:k]
+            best_idx, best_dist = best_idx[top], best_dist[top]
+
+        results = [(int(i), self.names[i], self.glosses[i], float(d)) for i, d in zip(best_idx, best_dist)]
+        stats = {"library": n, "candidates": len(cand), "dtw": n_dtw}
+        return results, stats
+
+    def suggest_gloss(self, query, k=5, **kwargs):
+        """检索 top-k 并投票得到推荐 gloss；已有检索结果时直接用 suggest_from_results。"""
+        results, _ = self.search(query, k=k, **kwargs)
+        return suggest_from_results(results)
+
+    def duplicates(self, max_dist, **kwargs):
+        """库内每个片段与其最近邻（排除自身）距离不超过 max_dist 的片段对，按距离升序。"""
+        pairs = {}
+        for i in range(len(self)):
+            results, _ = self.search(self.seqs[i], k=1, exclude=i, **kwargs)
+            if results and results[0][3] <= max_dist:
+                j, dist = results[0][0], results[0][3]
+                key = (min(i, j), max(i, j))
+                pairs[key] = min(dist, pairs.get(key, dist))
+        return [(self.names[i], self.names[j], d) for (i, j), d in sorted(pairs.items(), key=lambda p: p[1])]
+
+
+def suggest_from_results(results):
+    """search 结果按 1/距离 加权投票得到推荐 gloss，不再重复检索。"""
+    votes = {}
+    for _, _, gloss, dist in results:
+        votes[gloss] = votes.get(gloss, 0.0) + 1.0 / (dist + _EPS)
+    return max(votes, key=votes.get) if votes else None
+
+
+# ---------------------------------------------------------------------------
+# 4. 基准：库规模增长时的查询延迟
+# ---------------------------------------------------------------------------
+def _synthetic_library(n, rng, n_glosses=200):
+    """随机游走合成的片段：每个 gloss 一条原型，库中片段为原型加噪声与时间扭曲。"""
+    protos = np.cumsum(rng.normal(0, 0.1, (n_glosses, RESAMPLE_LENGTH, FEATURE_DIM)), axis=1).astype(np.float32)
+    labels = rng.integers(0, n_glosses, n)
+    seqs = np.empty((n, RESAMPLE_LENGTH, FEATURE_DIM), dtype=np.float32)
+    base = np.linspace(0, RESAMPLE_LENGTH - 1, RESAMPLE_LENGTH)
+    for i, g in enumerate(labels):
+        warp = np.clip(base + rng.normal(0, 1.0), 0, RESAMPLE_LENGTH - 1)
+        seqs[i] = resample(protos[g][np.round(np.sort(warp)).astype(int)])
+    seqs += rng.normal(0, 0.05, seqs.shape).astype(np.float32)
+    return [f"clip_{i}" for i in range(n)], [f"g{g}" for g in labels], seqs, protos
+
+
+def benchmark(sizes, n_queries=20, k=5, prefilter=PREFILTER_CANDIDATES, seed=0):
+    rng = np.random.default_rng(seed)
+    print(f"{'library':>8} {'median ms':>10} {'p95 ms':>8} {'candidates':>11} {'dtw':>6} {'top1 acc':>9}")
+    for n in sizes:
+        names, glosses, seqs, protos = _synthetic_library(n, rng)
+        index = SignIndex(names, glosses, seqs)
+        times, dtws, cands, hits = [], [], [], 0
+        for _ in range(n_queries):
+            g = int(rng.integers(0, len(protos)))
+            q = protos[g] + rng.normal(0, 0.05, protos[g].shape).astype(np.float32)
+            t0 = time.perf_counter()
+            results, stats = index.search(q, k=k, prefilter=prefilter)
+            times.append((time.perf_counter() - t0) * 1000)
+            dtws.append(stats["dtw"])
+            cands.append(stats["candidates"])
+            hits += bool(results) and results[0][2] == f"g{g}"
+        print(f"{n:>8} {np.median(times):>10.2f} {np.percentile(times, 95):>8.2f} "
+              f"{np.mean(cands):>11.0f} {np.mean(dtws):>6.1f} {hits / n_queries:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="手语片段最近邻检索（LB_Keogh 剪枝 DTW）")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("index", help="为素材库建索引")
+    p.add_argument("lib_dir")
+    p.add_argument("-o", "--output", default="sign_index.npz")
+
+    p = sub.add_parser("query", help="查询最相近的 k 个片段")
+    p.add_argument("index")
+    p.add_argument("clip", help="stroke_data 格式 JSON / NDJSON")
+    p.add_argument("-k", type=int, default=5)
+    p.add_argument("--prefilter", type=int, default=PREFILTER_CANDIDATES)
+
+    p = sub.add_parser("dups", help="列出疑似重复片段")
+    p.add_argument("index")
+    p.add_argument("--max-dist", type=float, default=1.0)
+
+    p = sub.add_parser("bench", help="合成库上的查询延迟基准")
+    p.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 10000, 20000])
+    p.add_argument("--queries", type=int, default=20)
+    p.add_argument("--prefilter", type=int, default=PREFILTER_CANDIDATES)
+    args = parser.parse_args()
+
+    if args.cmd == "index":
+        index = SignIndex.from_library(args.lib_dir)
+        index.save(args.output)
+        print(f"已索引 {len(index)} 个片段 → {args.output}")
+    elif args.cmd == "query":
+        index = SignIndex.load(args.index)
+        q = clip_features(args.clip)
+        results, stats = index.search(q, k=args.k, prefilter=args.prefilter)
+        for _, name, gloss, dist in results:
+            print(f"{dist:10.4f}  {gloss}  {name}")
+        print(f"推荐 gloss: {suggest_from_results(results)}  "
+              f"(候选 {stats['candidates']}, DTW {stats['dtw']} 次)")
+    elif args.cmd == "dups":
+        index = SignIndex.load(args.index)
+        for a, b, dist in index.duplicates(args.max_dist):
+            print(f"{dist:10.4f}  {a}  {b}")
+    else:
+        benchmark(args.sizes, n_queries=args.queries, prefilter=args.prefilter)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,7 @@ import { VRMLoaderPlugin, VRMHumanBoneName } from "@pixiv/three-vrm";
 let scene, camera, renderer, clock;
 let vrm = null;
 let frameData = null;
+let streamDone = false;
 let currentFrameIndex = 0;
 let playing = false;
 let accumulatedTime = 0;
@@ -20,6 +21,7 @@ const flipZQuat = new THREE.Quaternion().setFromAxisAngle(new THREE.Vector3(0, 0
 const _q = new THREE.Quaternion();
 const FRAME_DT = 1 / FPS;
 const IDENTITY_QUAT = [0, 0, 0, 1];
+const STROKE_DATA_URL = "/stroke_data_vrm_quaternions.ndjson";
 
 function pascalToCamel(str) {
   return str.charAt(0).toLowerCase() + str.slice(1);
@@ -164,12 +166,37 @@ function loadVRM() {
   );
 }
 
+// .ndjson：每行一帧，边下载边追加到 frameData，首帧到达即可播放；下载完成前播放停在已到达的最后一帧，完成后才循环。
+async function streamNdjson(url, onRecord) {
+  const r = await fetch(url);
+  if (!r.ok) throw new Error(`${r.status} ${r.statusText}`);
+  const reader = r.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  for (;;) {
+    const { done, value } = await reader.read();
+    buffer += decoder.decode(value ?? new Uint8Array(), { stream: !done });
+    let nl;
+    while ((nl = buffer.indexOf("\n")) >= 0) {
+      const line = buffer.slice(0, nl).trim();
+      buffer = buffer.slice(nl + 1);
+      if (line) onRecord(JSON.parse(line));
+    }
+    if (done) break;
+  }
+  if (buffer.trim()) onRecord(JSON.parse(buffer));
+}
+
 function loadStrokeData() {
-  fetch("/stroke_data_vrm_quaternions.json")
-    .then((r) => r.json())
-    .then((data) => {
-      frameData = data;
-      console.log("手语数据已加载，帧数:", data.length);
+  frameData = [];
+  streamDone = false;
+  streamNdjson(STROKE_DATA_URL, (record) => {
+    frameData.push(record);
+    if (frameData.length === 1) console.log("手语数据首帧已到达，可开始播放");
+  })
+    .then(() => {
+      streamDone = true;
+      console.log("手语数据已加载，帧数:", frameData.length);
     })
     .catch((err) => console.error("手语数据加载失败:", err));
 }
@@ -288,7 +315,9 @@ function animate() {
     while (accumulatedTime >= frameDt) {
       accumulatedTime -= frameDt;
       currentFrameIndex += 1;
-      if (currentFrameIndex >= frameData.length) currentFrameIndex = 0;
+      if (currentFrameIndex >= frameData.length) {
+        currentFrameIndex = streamDone ? 0 : frameData.length - 1;
+      }
     }
     applyFrame(currentFrameIndex);
     if (vrm?.update) vrm.update(delta);
@@ -8,22 +8,26 @@ import numpy as np
 from scipy.spatial.transform import Rotation
 from pathlib import Path
 
+from frame_stream import NdjsonWriter, is_ndjson_path, iter_frame_records
+
 # ---------------------------------------------------------------------------
 # 1. 坐标系转换：MediaPipe -> WebGL (Three.js / VRM)
 # ---------------------------------------------------------------------------
 # MediaPipe：通常 X 右、Y 下（图像）、Z 朝里（深度负值朝相机）。
 # WebGL/Three.js：X 右、Y 上、Z 朝相机。故需翻转 Y 和 Z。
-def mediapipe_to_webgl(p):
-    """将单点 [x,y,z] 从 MediaPipe 坐标系转到 WebGL 右手系。"""
-    return [float(p[0]), float(-p[1]), float(-p[2])]
+MEDIAPIPE_TO_WEBGL_SIGN = np.array([1.0, -1.0, -1.0])
+
+
+def _points_to_webgl(points):
+    """(N,3) 列表或数组整体转到 WebGL 系，返回列表；空输入返回 []。"""
+    if points is None or len(points) == 0:
+        return []
+    return (np.asarray(points, dtype=float) * MEDIAPIPE_TO_WEBGL_SIGN).tolist()
 
 
 def apply_webgl(pose, left_hand, right_hand):
-    """将 pose(33点) 与双手(各21点) 全部转到 WebGL 系。"""
-    pose_w = [mediapipe_to_webgl(pt) for pt in pose] if pose else []
-    left_w = [mediapipe_to_webgl(pt) for pt in left_hand] if left_hand else []
-    right_w = [mediapipe_to_webgl(pt) for pt in right_hand] if right_hand else []
-    return pose_w, left_w, right_w
+    """将 pose(33点) 与双手(各21点) 全部转到 WebGL 系。输入可为嵌套列表或 FrameStore 的数组切片。"""
+    return _points_to_webgl(pose), _points_to_webgl(left_hand), _points_to_webgl(right_hand)
 
 
 # ---------------------------------------------------------------------------
@@ -308,36 +312,64 @@ def frame_to_vrm_quaternions(pose, left_hand, right_hand):
 # ---------------------------------------------------------------------------
 # 7. 批量处理 stroke_data.json 并写回 JSON
 # ---------------------------------------------------------------------------
-def stroke_data_to_vrm_quaternions(stroke_data_path, out_path=None):
-    """
-    读取 stroke_data.json（每项含 frame, pose, left_hand, right_hand），
-    逐帧计算 VRM 局部四元数，写入 JSON。
-    """
-    path = Path(stroke_data_path)
-    with open(path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    if not isinstance(data, list):
-        data = [data]
-
-    out_list = []
-    for item in data:
-        frame = item.get("frame", len(out_list))
+def iter_vrm_quaternions(items):
+    """逐帧把 {frame, pose, left_hand, right_hand} 转为 {frame, quaternions}，边算边 yield。"""
+    for i, item in enumerate(items):
+        frame = item.get("frame", i)
         pose = item.get("pose", [])
         left_hand = item.get("left_hand", [])
         right_hand = item.get("right_hand", [])
         quats = frame_to_vrm_quaternions(pose, left_hand, right_hand)
-        out_list.append({"frame": frame, "quaternions": quats})
+        yield {"frame": frame, "quaternions": quats}
+
+
+def store_to_vrm_quaternions(store, indices=None):
+    """
+    直接从 FrameStore 的数组切片逐帧计算四元数，yield {frame, quaternions}。
+    indices 为 store 内位置（如 Stroke 帧），默认全部；pose 从未检测到的帧按空 pose 处理。
+    """
+    pose, pose_seen = store.filled("pose")
+    left, _ = store.filled("left_hand")
+    right, _ = store.filled("right_hand")
+    frames = store.frame
+    for i in (range(len(store)) if indices is None else indices):
+        quats = frame_to_vrm_quaternions(pose[i] if pose_seen[i] else [], left[i], right[i])
+        yield {"frame": int(frames[i]), "quaternions": quats}
 
+
+def default_output_path(stroke_data_path):
+    """默认输出：与输入同目录的 <stem>_vrm_quaternions.ndjson。"""
+    path = Path(stroke_data_path)
+    return path.parent / (path.stem + "_vrm_quaternions.ndjson")
+
+
+def stroke_data_to_vrm_quaternions(stroke_data_path, out_path=None):
+    """
+    读取 stroke_data.json（每项含 frame, pose, left_hand, right_hand），
+    逐帧计算 VRM 局部四元数并写出，返回写出的帧数。
+    默认输出 <stem>_vrm_quaternions.ndjson（前端播放器读取的格式）。
+    输入或输出为 .ndjson 时走流式：逐行读入、每算完一帧立即写出一行，内存不随帧数增长。
+    """
+    path = Path(stroke_data_path)
     if out_path is None:
-        out_path = path.parent / (path.stem + "_vrm_quaternions.json")
+        out_path = default_output_path(path)
+
+    records = iter_vrm_quaternions(iter_frame_records(path))
+    if is_ndjson_path(out_path):
+        with NdjsonWriter(out_path) as writer:
+            for record in records:
+                writer.write(record)
+        return writer.count
+
+    out_list = list(records)
     with open(out_path, "w", encoding="utf-8") as f:
         json.dump(out_list, f, ensure_ascii=False, indent=2)
-    return out_list
+    return len(out_list)
 
 
 if __name__ == "__main__":
     import sys
     inp = sys.argv[1] if len(sys.argv) > 1 else "stroke_data.json"
-    out = sys.argv[2] if len(sys.argv) > 2 else None
-    stroke_data_to_vrm_quaternions(inp, out)
-    print("已写入 VRM 局部四元数 JSON。")
+    out = sys.argv[2] if len(sys.argv) > 2 else default_output_path(inp)
+    n = stroke_data_to_vrm_quaternions(inp, out)
+    print(f"已写入 VRM 局部四元数: {out}（{n} 帧）")
@@ -1,5 +1,11 @@
 """
 手语视频 → Holistic 骨骼 + 面部锚点 + 手腕速度 + Stroke 检测 → stroke_data.json
+OUT_JSON 设为 .ndjson 时走流式：推理帧逐行落盘到临时文件（OUT_JSON 同目录的
+<stem>_holistic_frames.ndjson），内存中只保留速度序列，检测完 Stroke 后再流式筛出 Stroke 帧逐行写出；
+该临时文件与视频等长，导出后默认删除（KEEP_RAW_NDJSON = True 时保留）。
+OUT_QUATERNIONS 非空时，同时直接从 FrameStore 把 Stroke 帧重定向为 VRM 四元数（NDJSON）。
+RANGES 非空时只处理这些时间/帧区间：跳转到区间起点附近、短暂预热跟踪后只在区间内推理，
+输出的 frame 仍为原视频帧号，耗时与标注总时长成正比而与视频长度无关。
 依赖: opencv-python, mediapipe, numpy, scipy, matplotlib
 """
 import json
@@ -10,12 +16,23 @@ from scipy.signal import savgol_filter
 import matplotlib.pyplot as plt
 from pathlib import Path
 
+from frame_stream import NdjsonWriter, is_ndjson_path, iter_ndjson
+from frame_store import FrameStore, HAND_LANDMARKS_COUNT, frame_record
+from stroke_to_vrm_quaternions import store_to_vrm_quaternions, stroke_data_to_vrm_quaternions
+
 VIDEO_PATH = "test_video1.mp4"
 OUT_JSON = "stroke_data.json"
 OUT_PLOT = "velocity_stroke.png"
+KEEP_RAW_NDJSON = False   # 流式管线结束后是否保留全部推理帧的临时 NDJSON
+OUT_QUATERNIONS = None    # 如 "public/stroke_data_vrm_quaternions.ndjson"；None 表示不导出
+
+RANGES = None            # 如 [(12.0, 15.5), (3600.0, 3604.0)]；None 表示整段视频
+RANGES_IN_SECONDS = True  # False 时 RANGES 为帧号，均为左闭右开
+PREROLL_FRAMES = 15       # 每个区间前预热跟踪的帧数（推理但不输出）
+SEEK_MIN_GAP = 90         # 与上一位置相距不足此帧数时顺序 grab 跳过，否则 seek
+SEEK_MAX_TRIES = 6        # seek 落点越过目标时，逐次加倍后退重试的次数
 
 FACE_ANCHOR_INDICES = [1, 152, 162, 389, 9, 61, 291]
-FACE_ANCHOR_NAMES = ["nose_tip", "chin", "left_temple", "right_temple", "glabella", "mouth_left", "mouth_right"]
 POSE_LEFT_WRIST, POSE_RIGHT_WRIST = 15, 16
 
 SAVGOL_WINDOW = 11
@@ -23,116 +40,170 @@ SAVGOL_POLY = 3
 STROKE_VELOCITY_THRESHOLD_RATIO = 0.15
 STROKE_MIN_FRAMES = 3
 
-HAND_LANDMARKS_COUNT = 21
-PLACEHOLDER_HAND = [[0.0, 0.0, 0.0]] * HAND_LANDMARKS_COUNT
-
 
-def landmark_to_list(lm):
-    return [lm.x, lm.y, lm.z]
+def landmarks_to_array(landmarks):
+    if landmarks is None:
+        return None
+    return np.array([[lm.x, lm.y, lm.z] for lm in landmarks.landmark], dtype=np.float32)
 
 
 def extract_pose(pose_landmarks):
-    if pose_landmarks is None:
-        return None
-    return [landmark_to_list(lm) for lm in pose_landmarks.landmark]
+    return landmarks_to_array(pose_landmarks)
 
 
 def extract_hand(hand_landmarks):
-    if hand_landmarks is None:
+    hand = landmarks_to_array(hand_landmarks)
+    if hand is None or len(hand) != HAND_LANDMARKS_COUNT:
         return None
-    return [landmark_to_list(lm) for lm in hand_landmarks.landmark]
+    return hand
 
 
 def extract_face_anchors(face_landmarks):
     if face_landmarks is None:
         return None
-    out = []
-    for j, idx in enumerate(FACE_ANCHOR_INDICES):
-        lm = face_landmarks.landmark[idx]
-        out.append({"name": FACE_ANCHOR_NAMES[j], "xyz": [lm.x, lm.y, lm.z]})
-    return out
+    lms = face_landmarks.landmark
+    return np.array([[lms[idx].x, lms[idx].y, lms[idx].z] for idx in FACE_ANCHOR_INDICES], dtype=np.float32)
 
 
-def fill_or_keep(current, last):
-    if current is not None:
-        return current
-    return last
+def _new_holistic():
+    return mp.solutions.holistic.Holistic(
+        static_image_mode=False,
+        model_complexity=1,
+        smooth_landmarks=True,
+        min_detection_confidence=0.5,
+        min_tracking_confidence=0.5,
+    )
 
 
-def euclidean3d(a, b):
-    return float(np.sqrt((a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2 + (a[2] - b[2]) ** 2))
+def _process_frame(holistic, frame):
+    results = holistic.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    return (
+        extract_pose(results.pose_landmarks),
+        extract_hand(results.left_hand_landmarks),
+        extract_hand(results.right_hand_landmarks),
+        extract_face_anchors(results.face_landmarks),
+    )
 
 
-def run_holistic_on_video(video_path):
+def normalize_ranges(ranges, fps, in_seconds=True):
+    """区间列表 → 排序、合并后的左闭右开帧区间 [(start, end), ...]。"""
+    frame_ranges = []
+    for a, b in ranges:
+        if in_seconds:
+            # 容差吸收浮点误差：30fps 下 4.1*fps = 122.99999999999999，不应 floor 成 122
+            a, b = int(np.floor(a * fps + 1e-6)), int(np.ceil(b * fps - 1e-6))
+        a, b = max(int(a), 0), int(b)
+        if b > a:
+            frame_ranges.append((a, b))
+    merged = []
+    for a, b in sorted(frame_ranges):
+        if merged and a <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], b))
+        else:
+            merged.append((a, b))
+    return merged
+
+
+def _seek(cap, target):
+    """
+    跳转到不晚于 target 的位置，返回实际位置（下一次 read 得到的帧号）。
+    FFmpeg 后端在 VFR / B 帧流上落点不精确，故读回 CAP_PROP_POS_FRAMES；越过 target 时加倍后退重试。
+    """
+    back = 0
+    for _ in range(SEEK_MAX_TRIES):
+        aim = max(target - back, 0)
+        cap.set(cv2.CAP_PROP_POS_FRAMES, aim)
+        actual = int(round(cap.get(cv2.CAP_PROP_POS_FRAMES)))
+        if actual <= target or aim == 0:
+            return actual
+        back = max(2 * back, PREROLL_FRAMES)
+    return actual
+
+
+def _iter_ranges(cap, frame_ranges):
+    """
+    只解码/推理给定区间：远处用 CAP_PROP_POS_FRAMES 跳转（后端从之前最近的关键帧解码到目标帧），
+    近处顺序 grab。每个区间新建 Holistic，并在区间前 PREROLL_FRAMES 帧上预热跟踪状态。
+    """
+    pos = 0
+    for start, end in frame_ranges:
+        warm = max(start - PREROLL_FRAMES, pos)
+        if warm - pos > SEEK_MIN_GAP:
+            pos = _seek(cap, warm)
+        while pos < warm:
+            if not cap.grab():
+                return
+            pos += 1
+        with _new_holistic() as holistic:
+            while pos < end:
+                ret, frame = cap.read()
+                if not ret:
+                    return
+                parts = _process_frame(holistic, frame)
+                if pos >= start:
+                    yield (pos, *parts)
+                pos += 1
+
+
+def iter_holistic_results(video_path, ranges=None, in_seconds=None):
+    """
+    逐帧 yield (帧号, pose, left_hand, right_hand, face_anchors)，各部分为 float32 数组，未检测到为 None。
+    ranges 非空时只处理这些区间（见 normalize_ranges），帧号为原视频帧号；
+    in_seconds 为 None 时取模块常量 RANGES_IN_SECONDS。
+    """
+    if in_seconds is None:
+        in_seconds = RANGES_IN_SECONDS
     cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
         raise FileNotFoundError(f"无法打开视频: {video_path}")
-    mp_holistic = mp.solutions.holistic
-    all_frames_data = []
-    last_pose = last_face = None
-    last_good_left_hand = None
-    last_good_right_hand = None
-
-    with mp_holistic.Holistic(
-        static_image_mode=False,
-        model_complexity=1,
-        smooth_landmarks=True,
-        min_detection_confidence=0.5,
-        min_tracking_confidence=0.5,
-    ) as holistic:
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            results = holistic.process(rgb)
-
-            pose = fill_or_keep(extract_pose(results.pose_landmarks), last_pose)
-            face_anchors = fill_or_keep(extract_face_anchors(results.face_landmarks), last_face)
-
-            raw_left = extract_hand(results.left_hand_landmarks)
-            raw_right = extract_hand(results.right_hand_landmarks)
-
-            if raw_left is not None and len(raw_left) == HAND_LANDMARKS_COUNT:
-                left_hand = raw_left
-                last_good_left_hand = raw_left
-            else:
-                left_hand = last_good_left_hand if last_good_left_hand is not None else PLACEHOLDER_HAND
-
-            if raw_right is not None and len(raw_right) == HAND_LANDMARKS_COUNT:
-                right_hand = raw_right
-                last_good_right_hand = raw_right
-            else:
-                right_hand = last_good_right_hand if last_good_right_hand is not None else PLACEHOLDER_HAND
-
-            if pose is None:
-                pose = last_pose if last_pose is not None else []
-            if face_anchors is None:
-                face_anchors = last_face if last_face is not None else []
-
-            last_pose, last_face = pose, face_anchors
-            all_frames_data.append({
-                "pose": pose,
-                "left_hand": left_hand,
-                "right_hand": right_hand,
-                "face_anchors": face_anchors,
-            })
-    cap.release()
-    return all_frames_data
-
-
-def compute_wrist_velocity(all_frames_data):
-    n = len(all_frames_data)
-    v_left = np.zeros(n)
-    v_right = np.zeros(n)
-    for i in range(1, n):
-        p_prev = all_frames_data[i - 1]["pose"]
-        p_curr = all_frames_data[i]["pose"]
-        if len(p_prev) > max(POSE_LEFT_WRIST, POSE_RIGHT_WRIST) and len(p_curr) > max(POSE_LEFT_WRIST, POSE_RIGHT_WRIST):
-            v_left[i] = euclidean3d(p_curr[POSE_LEFT_WRIST], p_prev[POSE_LEFT_WRIST])
-            v_right[i] = euclidean3d(p_curr[POSE_RIGHT_WRIST], p_prev[POSE_RIGHT_WRIST])
-    velocity = (v_left + v_right) / 2.0
-    return velocity
+    try:
+        if ranges:
+            fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+            yield from _iter_ranges(cap, normalize_ranges(ranges, fps, in_seconds))
+            return
+        with _new_holistic() as holistic:
+            frame_idx = 0
+            while True:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                yield (frame_idx, *_process_frame(holistic, frame))
+                frame_idx += 1
+    finally:
+        cap.release()
+
+
+def run_holistic_on_video(video_path, ranges=None, in_seconds=None):
+    """逐帧推理，结果写入列式 FrameStore（缺失部分只记掩码，不复制上一帧）。"""
+    store = FrameStore()
+    for frame_idx, pose, left_hand, right_hand, face_anchors in iter_holistic_results(video_path, ranges, in_seconds):
+        store.append(frame_idx, pose, left_hand, right_hand, face_anchors)
+    return store
+
+
+def iter_holistic_on_video(video_path, ranges=None, in_seconds=None):
+    """流式版本：逐帧 yield 导出记录（缺失部分沿用最近一次有效值，不跨区间），不在内存中累积。"""
+    last = [None, None, None, None]
+    prev_idx = None
+    for frame_idx, *parts in iter_holistic_results(video_path, ranges, in_seconds):
+        if prev_idx is not None and frame_idx != prev_idx + 1:
+            last = [None, None, None, None]
+        prev_idx = frame_idx
+        last = [cur if cur is not None else prev for cur, prev in zip(parts, last)]
+        yield frame_record(frame_idx, *last)
+
+
+def wrist_step_velocity(p_prev, p_curr):
+    """相邻两帧 pose 的左右手腕平均位移；缺 pose 时为 0。"""
+    wrists = [POSE_LEFT_WRIST, POSE_RIGHT_WRIST]
+    if len(p_prev) > max(wrists) and len(p_curr) > max(wrists):
+        step = np.asarray(p_curr, dtype=float)[wrists] - np.asarray(p_prev, dtype=float)[wrists]
+        return float(np.linalg.norm(step, axis=-1).mean())
+    return 0.0
+
+
+def compute_wrist_velocity(store):
+    return store.wrist_velocity(POSE_LEFT_WRIST, POSE_RIGHT_WRIST)
 
 
 def smooth_velocity(velocity):
@@ -146,27 +217,50 @@ def smooth_velocity(velocity):
 def detect_stroke_segments(smoothed_velocity):
     thresh = float(np.percentile(smoothed_velocity, 20))
     thresh = max(thresh, np.median(smoothed_velocity) * STROKE_VELOCITY_THRESHOLD_RATIO)
-    below = smoothed_velocity < thresh
-    segments = []
-    i = 0
-    while i < len(below):
-        if below[i]:
-            start = i
-            while i < len(below) and below[i]:
-                i += 1
-            if i - start >= STROKE_MIN_FRAMES:
-                segments.append((start, i - 1))
-        else:
-            i += 1
+    below = (np.asarray(smoothed_velocity) < thresh).astype(np.int8)
+    edges = np.diff(np.concatenate(([0], below, [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    keep = ends - starts >= STROKE_MIN_FRAMES
+    segments = [(int(a), int(b) - 1) for a, b in zip(starts[keep], ends[keep])]
     return segments, thresh
 
 
-def plot_velocity_and_strokes(frames, smoothed_velocity, segments, thresh, out_path):
+def split_runs(frames):
+    """按帧号连续性把下标切成若干段；整段处理时只有一段。"""
+    frames = np.asarray(frames)
+    if len(frames) == 0:
+        return []
+    return np.split(np.arange(len(frames)), np.flatnonzero(np.diff(frames) != 1) + 1)
+
+
+def detect_strokes_per_run(frames, velocity):
+    """
+    每个连续帧段单独平滑、检测 Stroke（区间之间互不影响）。
+    返回 (平滑速度, Stroke 段 [(start, end)]（下标）, 各段阈值, 各段下标)。
+    """
+    velocity = np.asarray(velocity, dtype=float)
+    smoothed = np.zeros_like(velocity)
+    segments, thresholds = [], []
+    runs = split_runs(frames)
+    for run in runs:
+        smoothed[run] = smooth_velocity(velocity[run])
+        segs, thresh = detect_stroke_segments(smoothed[run])
+        segments += [(int(run[0]) + a, int(run[0]) + b) for a, b in segs]
+        thresholds.append(thresh)
+    return smoothed, segments, thresholds, runs
+
+
+def plot_velocity_and_strokes(frames, smoothed_velocity, segments, thresholds, runs, out_path):
+    """frames 为原视频帧号；segments 为下标段，按帧号绘制。"""
+    frames = np.asarray(frames)
     fig, ax = plt.subplots(figsize=(12, 4))
-    ax.plot(frames, smoothed_velocity, color="steelblue", linewidth=1, label="velocity")
-    ax.axhline(thresh, color="gray", linestyle="--", alpha=0.7, label="Stroke threshold")
+    for k, (run, thresh) in enumerate(zip(runs, thresholds)):
+        ax.plot(frames[run], smoothed_velocity[run], color="steelblue", linewidth=1, label="velocity" if k == 0 else "")
+        ax.hlines(thresh, frames[run[0]], frames[run[-1]] + 1, color="gray", linestyle="--", alpha=0.7,
+                  label="Stroke threshold" if k == 0 else "")
     for start, end in segments:
-        ax.axvspan(start, end + 1, alpha=0.35, color="coral", label="Stroke" if start == segments[0][0] else "")
+        ax.axvspan(frames[start], frames[end] + 1, alpha=0.35, color="coral", label="Stroke" if start == segments[0][0] else "")
     ax.set_xlabel("frame")
     ax.set_ylabel("wrist velocity (smoothed)")
     ax.legend(loc="upper right")
@@ -176,51 +270,94 @@ def plot_velocity_and_strokes(frames, smoothed_velocity, segments, thresh, out_p
     plt.close()
 
 
-def frame_to_export_item(frame_idx, data):
-    return {
-        "frame": frame_idx,
-        "pose": data["pose"],
-        "left_hand": data["left_hand"],
-        "right_hand": data["right_hand"],
-        "face_anchors": data["face_anchors"],
-    }
+def stroke_frame_set(segments):
+    stroke_frames = set()
+    for start, end in segments:
+        for f in range(start, end + 1):
+            stroke_frames.add(f)
+    return stroke_frames
+
+
+def main_streaming(video_path):
+    """流式管线：推理帧逐行写入临时 NDJSON 并增量计算速度，最后从中流式筛出 Stroke 帧。"""
+    out_path = Path(OUT_JSON)
+    raw_path = out_path.with_name(out_path.stem + "_holistic_frames.ndjson")
+    try:
+        _run_streaming(video_path, raw_path)
+    finally:
+        if not KEEP_RAW_NDJSON:
+            raw_path.unlink(missing_ok=True)
+    print("完成.")
+
+
+def _run_streaming(video_path, raw_path):
+    print(f"1. 逐帧 Holistic 推理（流式写入 {raw_path}）...")
+    velocity, frames = [], []
+    prev_pose = prev_frame = None
+    with NdjsonWriter(raw_path) as raw:
+        for item in iter_holistic_on_video(str(video_path), RANGES):
+            contiguous = prev_pose is not None and item["frame"] == prev_frame + 1
+            velocity.append(wrist_step_velocity(prev_pose, item["pose"]) if contiguous else 0.0)
+            frames.append(item["frame"])
+            prev_pose, prev_frame = item["pose"], item["frame"]
+            raw.write(item)
+    n_frames = len(velocity)
+    print(f"   共 {n_frames} 帧")
+
+    print("2-3. 平滑手腕速度并检测 Stroke 阶段...")
+    smoothed, segments, thresholds, runs = detect_strokes_per_run(frames, velocity)
+    stroke_frames = {frames[i] for i in stroke_frame_set(segments)}
+    print(f"   区间数={len(runs)}, 阈值={', '.join(f'{t:.6f}' for t in thresholds)}, "
+          f"Stroke 区间数={len(segments)}, Stroke 总帧数={len(stroke_frames)}")
+
+    print("4. 可视化...")
+    plot_velocity_and_strokes(frames, smoothed, segments, thresholds, runs, OUT_PLOT)
+
+    print(f"5. 流式导出 {OUT_JSON}...")
+    with NdjsonWriter(OUT_JSON) as out:
+        for item in iter_ndjson(raw_path):
+            if item["frame"] in stroke_frames:
+                out.write(item)
+
+    if OUT_QUATERNIONS:
+        print(f"6. 流式重定向 Stroke 帧为 VRM 四元数 → {OUT_QUATERNIONS}...")
+        stroke_data_to_vrm_quaternions(OUT_JSON, OUT_QUATERNIONS)
 
 
 def main():
     video_path = Path(VIDEO_PATH)
     if not video_path.is_file():
         raise FileNotFoundError(f"请将测试视频放在: {video_path.absolute()}")
+    if is_ndjson_path(OUT_JSON):
+        main_streaming(video_path)
+        return
 
     print("1. 逐帧 Holistic 推理...")
-    all_frames_data = run_holistic_on_video(str(video_path))
-    n_frames = len(all_frames_data)
-    print(f"   共 {n_frames} 帧")
+    store = run_holistic_on_video(str(video_path), RANGES)
+    n_frames = len(store)
+    print(f"   共 {n_frames} 帧, 占用 {store.nbytes() / 1024:.1f} KB")
 
-    print("2. 计算手腕速度并平滑...")
-    velocity = compute_wrist_velocity(all_frames_data)
-    smoothed = smooth_velocity(velocity)
-
-    print("3. Stroke 阶段检测...")
-    segments, thresh = detect_stroke_segments(smoothed)
-    stroke_frames = set()
-    for start, end in segments:
-        for f in range(start, end + 1):
-            stroke_frames.add(f)
-    print(f"   阈值={thresh:.6f}, Stroke 区间数={len(segments)}, Stroke 总帧数={len(stroke_frames)}")
+    print("2-3. 计算手腕速度，平滑并检测 Stroke 阶段...")
+    velocity = compute_wrist_velocity(store)
+    smoothed, segments, thresholds, runs = detect_strokes_per_run(store.frame, velocity)
+    stroke_frames = stroke_frame_set(segments)
+    print(f"   区间数={len(runs)}, 阈值={', '.join(f'{t:.6f}' for t in thresholds)}, "
+          f"Stroke 区间数={len(segments)}, Stroke 总帧数={len(stroke_frames)}")
 
     print("4. 可视化...")
-    plot_velocity_and_strokes(
-        list(range(n_frames)), smoothed, segments, thresh, OUT_PLOT
-    )
+    plot_velocity_and_strokes(store.frame, smoothed, segments, thresholds, runs, OUT_PLOT)
 
     print("5. 导出 stroke_data.json...")
-    stroke_list = [
-        frame_to_export_item(i, all_frames_data[i])
-        for i in sorted(stroke_frames)
-    ]
+    stroke_list = list(store.iter_records(sorted(stroke_frames)))
     with open(OUT_JSON, "w", encoding="utf-8") as f:
         json.dump(stroke_list, f, ensure_ascii=False, indent=2)
 
+    if OUT_QUATERNIONS:
+        print(f"6. 重定向 Stroke 帧为 VRM 四元数 → {OUT_QUATERNIONS}...")
+        with NdjsonWriter(OUT_QUATERNIONS) as out:
+            for record in store_to_vrm_quaternions(store, sorted(stroke_frames)):
+                out.write(record)
+
     print("完成.")
 
 